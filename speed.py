@@ -1,171 +1,352 @@
+import asyncio
+import aiohttp
 import requests
-import json
-from typing import Optional, Tuple, List, Dict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple, List, Dict
+import socket
+import statistics
 import sys
-from tabulate import tabulate
+import time
+
+CONNECTION_HELP = (
+    "\nPossible solutions:\n"
+    "1. Make sure Ollama is running\n"
+    "2. Check if the host and port are correct\n"
+    "3. If using a remote server, ensure the server is accessible\n"
+    "\nTo start Ollama locally, run: ollama serve\n"
+)
+
+# How long /tags and /version responses are reused before asking the server again
+CACHE_TTL_SECONDS = 30
+
+# (connect, read) timeouts in seconds; generation reads are left unbounded since they may take minutes
+CONNECT_TIMEOUT = 3
+METADATA_TIMEOUT = (CONNECT_TIMEOUT, 15)
+
+# How long the server keeps a model loaded after a request
+KEEP_ALIVE = "5m"
+
+# Built once and shared by every generate request
+PROMPT = "Why is the sky blue?"
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+# Byte thresholds for format_size
+GB, MB = 1 << 30, 1 << 20
+
+RESULT_HEADERS = ("Model", "Size", "Family", "Parameters", "Median t/s", "P95 t/s", "Wall t/s", "Tokens")
+
+@dataclass(slots=True)
+class Result:
+    """One row of the results table"""
+    model: str
+    size: str
+    family: str
+    parameters: str
+    speed: float
+    p95_speed: float
+    wall_speed: float
+    tokens: int
+
+def calculate_speed(response_data: dict, wall_duration: int = 0) -> float:
+    """Tokens per second from the server's eval_count and eval_duration (ns)"""
+    # Fall back to the client-measured duration when the server omits eval_duration
+    eval_duration = response_data.get("eval_duration") or wall_duration
+    # Single multiply/divide; max() guards against a missing or zero duration
+    return response_data.get("eval_count", 0) * 1e9 / max(eval_duration, 1)
+
+def calculate_wall_speed(response_data: dict, wall_duration: int) -> float:
+    """Tokens per second over the client-measured request duration (ns)"""
+    return response_data.get("eval_count", 0) * 1e9 / max(wall_duration, 1)
+
+def summarize_trials(samples: List[Tuple[float, float, dict]]) -> Tuple[float, float, float, dict]:
+    """Median and p95 server speed, median wall speed and the last response of several trials"""
+    speeds = [speed for speed, _, _ in samples]
+    # quantiles() needs at least two points; a single trial is its own p95
+    p95 = statistics.quantiles(speeds, n=20, method="inclusive")[18] if len(speeds) > 1 else speeds[0]
+    wall_speed = statistics.median(wall for _, wall, _ in samples)
+    return statistics.median(speeds), p95, wall_speed, samples[-1][2]
 
 class OllamaConnection:
     def __init__(self, host: str = "localhost", port: int = 11434):
         self.host = host
         self.port = port
         self.base_url = f"http://{host}:{port}/api"
-        self.results: List[Dict] = []
+
+        # Resolve the host once and address the server by IP so later calls skip DNS
+        try:
+            self.ip_address = socket.gethostbyname(host)
+            self._url_base = f"http://{self.ip_address}:{port}/api"
+        except socket.gaierror:
+            self.ip_address = "Unable to resolve IP"
+            self._url_base = self.base_url
+        self.host_header = f"{host}:{port}"
+        self.results: List[Result] = []
+        self._cache: Dict[str, Tuple[float, Any]] = {}
+
+        # Reuse pooled keep-alive connections instead of a new handshake per call
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=Retry(total=2, backoff_factor=0.1))
+        self.session.mount("http://", adapter)
+        self.session.headers["Host"] = self.host_header
+        self._async_headers = {**JSON_HEADERS, 'Host': self.host_header}
+
         self.verify_connection()
     
     def verify_connection(self):
         """Verify connection to Ollama server and print version info"""
         try:
-            # Get IP address
-            try:
-                import socket
-                ip_address = socket.gethostbyname(self.host)
-            except socket.gaierror:
-                ip_address = "Unable to resolve IP"
-
-            response = requests.get(f"{self.base_url}/version", timeout=5)  # Add timeout
-            if response.status_code == 200:
-                version_info = response.json()
-                print("\nOllama Server Connection Info:")
-                print("─" * 40)
-                print(f"Status:         Connected")
-                print(f"Host:           {self.host}")
-                print(f"IP Address:     {ip_address}")
-                print(f"Port:           {self.port}")
-                print(f"Ollama Version: {version_info.get('version', 'unknown')}")
-                print(f"API URL:        {self.base_url}")
-                print("─" * 40)
+            status_code, version_info = self._get_json("version")
+            if status_code == 200:
+                sys.stdout.write(
+                    "\nOllama Server Connection Info:\n"
+                    f"{'─' * 40}\n"
+                    "Status:         Connected\n"
+                    f"Host:           {self.host}\n"
+                    f"IP Address:     {self.ip_address}\n"
+                    f"Port:           {self.port}\n"
+                    f"Ollama Version: {version_info.get('version', 'unknown')}\n"
+                    f"API URL:        {self.base_url}\n"
+                    f"{'─' * 40}\n"
+                )
             else:
-                raise ConnectionError(f"Server returned status code: {response.status_code}")
+                raise ConnectionError(f"Server returned status code: {status_code}")
         except requests.Timeout:
-            print("\nError: Connection timed out!")
-            print(f"Could not connect to Ollama server at {self.host}:{self.port}")
-            print("\nPossible solutions:")
-            print("1. Make sure Ollama is running")
-            print("2. Check if the host and port are correct")
-            print("3. If using a remote server, ensure the server is accessible")
-            print("\nTo start Ollama locally, run: ollama serve")
+            sys.stdout.write(
+                "\nError: Connection timed out!\n"
+                f"Could not connect to Ollama server at {self.host}:{self.port}\n"
+                + CONNECTION_HELP
+            )
             sys.exit(1)
         except requests.ConnectionError:
-            print("\nError: Could not connect to Ollama server!")
-            print(f"Failed to establish connection to {self.host}:{self.port}")
-            print("\nPossible solutions:")
-            print("1. Make sure Ollama is running")
-            print("2. Check if the host and port are correct")
-            print("3. If using a remote server, ensure the server is accessible")
-            print("\nTo start Ollama locally, run: ollama serve")
+            sys.stdout.write(
+                "\nError: Could not connect to Ollama server!\n"
+                f"Failed to establish connection to {self.host}:{self.port}\n"
+                + CONNECTION_HELP
+            )
             sys.exit(1)
         except Exception as e:
-            print(f"\nUnexpected error while connecting to Ollama server:")
-            print(f"Error details: {str(e)}")
-            print("\nPlease check your configuration and try again.")
+            sys.stdout.write(
+                "\nUnexpected error while connecting to Ollama server:\n"
+                f"Error details: {str(e)}\n"
+                "\nPlease check your configuration and try again.\n"
+            )
             sys.exit(1)
 
+    def _get_json(self, endpoint: str, timeout: Tuple[float, Optional[float]] = METADATA_TIMEOUT) -> Tuple[int, Any]:
+        """GET a metadata endpoint, reusing a successful response for CACHE_TTL_SECONDS"""
+        url = f"{self._url_base}/{endpoint}"
+        cached = self._cache.get(url)
+        if cached is not None and time.monotonic() - cached[0] < CACHE_TTL_SECONDS:
+            return 200, cached[1]
+
+        response = self.session.get(url, timeout=timeout)
+        if response.status_code != 200:
+            return response.status_code, None
+
+        data = orjson.loads(response.content)
+        self._cache[url] = (time.monotonic(), data)
+        return response.status_code, data
+
     def format_size(self, size_bytes: int) -> str:
         """Convert bytes to human readable format (MB/GB)"""
-        mb = size_bytes / (1024 * 1024)
-        if mb >= 1024:
-            return f"{mb/1024:.2f} GB"
-        return f"{mb:.2f} MB"
+        if size_bytes >= GB:
+            return f"{size_bytes / GB:.2f} GB"
+        return f"{size_bytes / MB:.2f} MB"
 
     def list_models(self) -> list:
         """Get list of available models"""
-        response = requests.get(f"{self.base_url}/tags")
+        status_code, data = self._get_json("tags")
         
-        if response.status_code == 200:
-            data = response.json()
+        if status_code == 200:
             models = data["models"]
             print(f"\nFound {len(models)} model(s) on the server")
             return models
         else:
-            print(f"Error: Failed to retrieve models. Status code: {response.status_code}")
+            print(f"Error: Failed to retrieve models. Status code: {status_code}")
             return []
 
-    def measure_model_speed(self, model_name: str) -> Tuple[float, dict]:
-        """Measure speed for a specific model"""
-        url = f"{self.base_url}/generate"
-        payload = {
+    def create_async_session(self, max_concurrency: int) -> aiohttp.ClientSession:
+        """aiohttp session with keep-alive, cached DNS and the JSON/Host headers preset"""
+        connector = aiohttp.TCPConnector(limit=max(32, max_concurrency), ttl_dns_cache=300, keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT)
+        return aiohttp.ClientSession(connector=connector, timeout=timeout, headers=self._async_headers)
+
+    def _warmup_payload(self, model_name: str) -> dict:
+        """One-token request that loads the model without measuring anything"""
+        return {
             "model": model_name,
-            "prompt": "Why is the sky blue?",
-            "stream": False
+            "prompt": "hi",
+            "stream": False,
+            "keep_alive": KEEP_ALIVE,
+            "options": {"num_predict": 1}
         }
-        headers = {'Content-Type': 'application/json'}
 
-        response = requests.post(url, data=json.dumps(payload), headers=headers)
-        response_data = response.json()
-        
-        eval_count = response_data.get("eval_count", 0)
-        eval_duration = response_data.get("eval_duration", 1)  # Prevent division by zero
-        eval_duration_seconds = eval_duration / 1e9
-        speed = eval_count / eval_duration_seconds
-        
-        return speed, response_data
+    def _generate_payload(self, model_name: str) -> dict:
+        """Streamed request for a timed run"""
+        return {
+            "model": model_name,
+            "prompt": PROMPT,
+            "stream": True,
+            "keep_alive": KEEP_ALIVE
+        }
+
+    async def _warmup_async(self, session: aiohttp.ClientSession, model_name: str):
+        """Load the model into memory so the timed runs measure steady-state speed"""
+        async with session.post(f"{self._url_base}/generate", data=orjson.dumps(self._warmup_payload(model_name))) as response:
+            response.raise_for_status()
+            response_data = orjson.loads(await response.read())
+        if "error" in response_data:
+            raise RuntimeError(response_data["error"])
+
+    async def measure_model_speed_async(self, session: aiohttp.ClientSession, model_name: str) -> Tuple[float, float, dict]:
+        """Run one timed generation on a create_async_session() session; call _warmup_async first"""
+        url = f"{self._url_base}/generate"
+        payload = self._generate_payload(model_name)
+
+        # Only the final (done) chunk carries the timing fields; tokens are just counted.
+        # Reading to EOF lets aiohttp return the connection to the keep-alive pool
+        response_data = {}
+        response_length = 0
+        t0 = time.perf_counter_ns()
+        async with session.post(url, data=orjson.dumps(payload)) as response:
+            response.raise_for_status()
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                response_data = orjson.loads(line)
+                # Ollama reports failures mid-stream as an {"error": ...} object
+                if "error" in response_data:
+                    raise RuntimeError(response_data["error"])
+                response_length += len(response_data.get("response", ""))
+        t1 = time.perf_counter_ns()
+        response_data["response_length"] = response_length
 
-    def add_result(self, model_name: str, size: str, family: str, parameters: str, speed: float, tokens: int):
+        speed = calculate_speed(response_data, t1 - t0)
+        wall_speed = calculate_wall_speed(response_data, t1 - t0)
+
+        return speed, wall_speed, response_data
+
+    def add_result(self, model_name: str, size: str, family: str, parameters: str, speed: float, p95_speed: float, wall_speed: float,
+                   tokens: int):
         """Store a test result"""
-        self.results.append({
-            "Model": model_name,
-            "Size": size,
-            "Family": family,
-            "Parameters": parameters,
-            "Speed (t/s)": f"{speed:.2f}",
-            "Tokens": tokens
-        })
+        self.results.append(Result(model_name, size, family, parameters, speed, p95_speed, wall_speed, tokens))
+
+    def format_results_table(self) -> str:
+        """Render results as an aligned text table"""
+        rows = [
+            (r.model, r.size, r.family, r.parameters,
+             f"{r.speed:.2f}", f"{r.p95_speed:.2f}", f"{r.wall_speed:.2f}", str(r.tokens))
+            for r in self.results
+        ]
+        widths = [max(len(header), *(len(row[i]) for row in rows)) for i, header in enumerate(RESULT_HEADERS)]
+        separator = "-+-".join("-" * width for width in widths)
+
+        lines = [" | ".join(header.ljust(width) for header, width in zip(RESULT_HEADERS, widths)), separator]
+        for row in rows:
+            lines.append(" | ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+        return "\n".join(lines)
 
     def print_results_table(self):
         """Print results in a table format"""
         if not self.results:
             return
         
-        print("\nTest Results Summary:")
-        print("─" * 100)
-        print(tabulate(self.results, headers="keys", tablefmt="grid"))
-        print("─" * 100)
+        sys.stdout.write("\n".join([
+            "\nTest Results Summary:",
+            "─" * 100,
+            self.format_results_table(),
+            "─" * 100,
+        ]) + "\n")
+
+async def amain(host: str, port: int, max_concurrency: int, model_timeout: Optional[float] = None,
+                trials: int = 1):
+    # Initialize connection
+    ollama = OllamaConnection(host, port)
+
+    # Get models
+    models = ollama.list_models()
+    total_models = len(models)
+    sem = asyncio.Semaphore(max_concurrency)
+
+    async def run(index: int, model: dict, session: aiohttp.ClientSession):
+        model_name = model["name"]
+        size = ollama.format_size(model['size'])
+        details = model['details']
+        family = details.get('family', 'unknown')
+        parameters = details.get('parameter_size', 'unknown')
 
-def main(host: Optional[str] = None, port: Optional[int] = None):
+        async def measure():
+            await ollama._warmup_async(session, model_name)
+            return [await ollama.measure_model_speed_async(session, model_name) for _ in range(trials)]
+
+        try:
+            # One slot covers the warmup and every trial, so the model stays loaded between them;
+            # the budget covers the whole model so one hung model can't stall the gather
+            async with sem:
+                print(f"\nTesting model ({index}/{total_models}): {model_name}")
+                samples = await asyncio.wait_for(measure(), timeout=model_timeout)
+        except aiohttp.ServerTimeoutError as e:
+            # Subclasses asyncio.TimeoutError, so it must be caught before the model budget branch
+            sys.stdout.write(
+                f"\nModel ({index}/{total_models}): {model_name}\n"
+                f"  Error measuring speed: {str(e) or 'server connection timed out'}\n"
+            )
+            return
+        except asyncio.TimeoutError:
+            sys.stdout.write(
+                f"\nModel ({index}/{total_models}): {model_name}\n"
+                f"  Error measuring speed: timed out after {model_timeout}s\n"
+            )
+            return
+        except Exception as e:
+            sys.stdout.write(
+                f"\nModel ({index}/{total_models}): {model_name}\n"
+                f"  Error measuring speed: {str(e)}\n"
+            )
+            return
+
+        speed, p95_speed, wall_speed, response_data = summarize_trials(samples)
+        tokens = response_data.get('eval_count', 0)
+
+        # One write per model keeps concurrent reports from interleaving
+        sys.stdout.write("\n".join([
+            f"\nModel ({index}/{total_models}): {model_name}",
+            "Model details:",
+            f"  Size:           {size}",
+            f"  Details:        family={family} params={parameters} "
+            f"quant={details.get('quantization_level', 'unknown')} fmt={details.get('format', 'unknown')}",
+            "Performance metrics:",
+            f"  Trials:         {trials}",
+            f"  Median speed:   {speed:.2f} tokens/second",
+            f"  P95 speed:      {p95_speed:.2f} tokens/second",
+            f"  Wall speed:     {wall_speed:.2f} tokens/second",
+            f"  Total tokens:   {tokens}",
+            f"  Response length: {response_data.get('response_length', 0)}",
+        ]) + "\n")
+
+        # Store the result
+        ollama.add_result(model_name, size, family, parameters, speed, p95_speed, wall_speed, tokens)
+
+    # Measure speed for all models concurrently, bounded by the semaphore
+    async with ollama.create_async_session(max_concurrency) as session:
+        await asyncio.gather(*[run(index, model, session) for index, model in enumerate(models, 1)])
+
+    # Print results table at the end
+    ollama.print_results_table()
+
+def main(host: Optional[str] = None, port: Optional[int] = None, max_concurrency: Optional[int] = None,
+         model_timeout: Optional[float] = None, trials: Optional[int] = None):
     # Use default values if not provided
     host = host or "localhost"
     port = port or 11434
-    
+    max_concurrency = 1 if max_concurrency is None else max_concurrency
+    trials = 5 if trials is None else trials
+
     try:
-        # Initialize connection
-        ollama = OllamaConnection(host, port)
-        
-        # Get models
-        models = ollama.list_models()
-        total_models = len(models)
-        
-        # Measure speed for each model
-        for index, model in enumerate(models, 1):
-            model_name = model["name"]
-            print(f"\nTesting model ({index}/{total_models}): {model_name}")
-            print("Model details:")
-            size = ollama.format_size(model['size'])
-            details = model['details']
-            family = details.get('family', 'unknown')
-            parameters = details.get('parameter_size', 'unknown')
-            
-            print(f"  Size:           {size}")
-            print(f"  Family:         {family}")
-            print(f"  Parameters:     {parameters}")
-            
-            try:
-                speed, response_data = ollama.measure_model_speed(model_name)
-                tokens = response_data.get('eval_count', 0)
-                
-                print(f"Performance metrics:")
-                print(f"  Speed:          {speed:.2f} tokens/second")
-                print(f"  Total tokens:   {tokens}")
-                print(f"  Response length: {len(response_data.get('response', ''))}")
-                
-                # Store the result
-                ollama.add_result(model_name, size, family, parameters, speed, tokens)
-                
-            except Exception as e:
-                print(f"  Error measuring speed: {str(e)}")
-        
-        # Print results table at the end
-        ollama.print_results_table()
-                
+        asyncio.run(amain(host, port, max_concurrency, model_timeout, trials))
     except ConnectionError as e:
         print(f"Connection error: {str(e)}")
     except Exception as e:
@@ -173,10 +354,19 @@ def main(host: Optional[str] = None, port: Optional[int] = None):
 
 if __name__ == "__main__":
     import argparse
+
+    def positive_int(value: str) -> int:
+        number = int(value)
+        if number < 1:
+            raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+        return number
     
     parser = argparse.ArgumentParser(description='Measure Ollama model speeds')
     parser.add_argument('--host', type=str, help='Ollama server host (default: localhost)')
     parser.add_argument('--port', type=int, help='Ollama server port (default: 11434)')
+    parser.add_argument('--max_concurrency', type=positive_int, help='Number of models to test at the same time (default: 1)')
+    parser.add_argument('--model_timeout', type=float, help='Seconds allowed per model, warmup and trials included (default: no limit)')
+    parser.add_argument('--trials', type=positive_int, help='Timed runs per model (default: 5)')
     
     args = parser.parse_args()
-    main(args.host, args.port)
\ No newline at end of file
+    main(args.host, args.port, args.max_concurrency, args.model_timeout, args.trials)
\ No newline at end of file